@@ -1,63 +1,204 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
-import os
+import numpy as np
+import json
+from fert_data import DATA_FILE, load_and_clean_data
 
 # --- Configuração Inicial ---
 # Define o título da página e o layout para 'wide' (usa toda a largura da tela)
 st.set_page_config(page_title="Comparador de Fertilizantes - Golf", layout="wide")
-DATA_FILE = 'Fertilizante.csv'
-
-# --- Carregamento e Limpeza de Dados ---
-# @st.cache_data armazena o resultado da função em cache para acelerar o recarregamento
-@st.cache_data
-def load_and_clean_data():
-    # Verifica se o arquivo existe antes de tentar carregar
-    if not os.path.exists(DATA_FILE):
-        return None
+# Acima deste número de barras os rótulos de valor são omitidos (cada rótulo é um nó SVG a desenhar)
+MAX_BAR_LABELS = 30
+# Quantos produtos mais eficientes mostrar por defeito no gráfico de eficiência
+TOP_EFFICIENCY = 20
+# Máximo de barras no gráfico de custo: acima disso mostra os mais caros e agrupa o resto em 'Outros'
+MAX_COST_BARS = 30
+
+# --- Filtragem e Colunas Derivadas ---
+# Em cache: a mesma combinação de filtros não refaz máscara nem cálculos a cada interação
+# max_entries limita quantas combinações ficam guardadas (as mais antigas são descartadas)
+@st.cache_data(max_entries=64)
+def build_view(cats: tuple, fabs: tuple, techs: tuple) -> pd.DataFrame:
+    df = load_and_clean_data()[0]
+
+    # Junta uma condição por filtro ativo e combina todas num único AND vetorizado
+    conds = []
+    if 'Categoria' in df.columns and cats:
+        conds.append(df['Categoria'].isin(cats).to_numpy())
+    if 'Fabricante' in df.columns and fabs:
+        conds.append(df['Fabricante'].isin(fabs).to_numpy())
+    if 'Tecnologia' in df.columns and techs:
+        conds.append(df['Tecnologia'].isin(techs).to_numpy())
+    # Sem filtros ativos a máscara é tudo True
+    mask = np.logical_and.reduce(conds) if conds else np.ones(len(df), dtype=bool)
+
+    # Cria um novo DataFrame apenas com os dados filtrados
+    # A máscara é um array numpy simples: 'iloc' seleciona por posição, sem alinhar índices
+    filtered_df = df.iloc[mask]
+
+    if {'N', 'Custo_por_Ha', 'KG_por_Ha'}.issubset(filtered_df.columns):
+        # --- Cálculo de Eficiência ---
+
+        # 1. Calcula quantos KG de Nitrogênio puro estamos jogando no campo por Hectare
+        # Cálculo: (Kg totais do produto por Ha) * (% de Azoto / 100)
+        un = filtered_df['KG_por_Ha'].to_numpy(dtype=float) * filtered_df['N'].to_numpy(dtype=float) / 100.0
+
+        # 2. Calcula quanto custa cada kg de Nitrogênio puro
+        # Cálculo: (Custo Total por Ha) / (Unidades de N por Ha)
+        # Divisão vetorizada: onde não há N aplicado o custo fica em 0 (evita divisão por zero)
+        cpn = np.zeros_like(un)
+        np.divide(filtered_df['Custo_por_Ha'].to_numpy(dtype=float), un, out=cpn, where=un > 0)
+
+        # 'assign' devolve um DataFrame novo de uma só vez: sem escrita sobre a fatia filtrada
+        filtered_df = filtered_df.assign(Unidades_N_Ha=un, Custo_Por_Unidade_N=cpn)
+
+    return filtered_df
+
+# --- Construção dos Gráficos (em cache) ---
+# Cada figura é montada e serializada para JSON uma única vez por conjunto de dados
+# Em reexecuções com os mesmos dados o Streamlit devolve o JSON guardado sem recriar a figura
+# max_entries limita o cache: cada filtro (e cada valor do slider de eficiência) gera uma entrada
+
+@st.cache_data(max_entries=64)
+def build_npk_fig_json(filtered_df: pd.DataFrame) -> str:
+    # --- Cores Tema Golf ---
+    # N (Crescimento Foliar) -> Verde Escuro (DarkGreen)
+    # P (Raízes) -> Verde Oliva/Terra (DarkOliveGreen)
+    # K (Resistência) -> Verde Amarelado/Vibrante (YellowGreen)
+    golf_colors = {
+        'N': '#006400',  
+        'P': '#556B2F',  
+        'K': '#9ACD32'   
+    }
+    show_labels = len(filtered_df) <= MAX_BAR_LABELS
     
-    # Tenta ler o arquivo com diferentes codificações, priorizando utf-8/utf-8-sig
-    # A ordem importa! utf-8 não aceita bytes invalidos, enquanto latin1 aceita quase tudo como errado.
-    for encoding in ['utf-8', 'utf-8-sig', 'latin1', 'cp1252']:
-        try:
-            df = pd.read_csv(DATA_FILE, encoding=encoding)
-            break
-        except:
-            continue
-            
-    # --- Padronização dos Nomes das Colunas ---
-    # O objetivo é garantir que o código entenda as colunas independentemente de pequenas variações no CSV
-    # Exemplo: 'N (%)' vira apenas 'N'
+    # Uma série de barras por nutriente, empilhadas, lidas diretamente das colunas N/P/K
+    fig_npk = go.Figure()
+    for nutriente, color in golf_colors.items():
+        fig_npk.add_bar(
+            x=filtered_df['Produto'],
+            y=filtered_df[nutriente],
+            name=nutriente,
+            marker_color=color, # Aplica o mapa de cores definido acima
+            texttemplate='%{y}' if show_labels else None
+        )
+    fig_npk.update_layout(
+        title="Comparação N-P-K por Produto",
+        barmode='stack',
+        legend_title_text='Nutriente',
+        xaxis_title='Produto',
+        yaxis_title='Porcentagem'
+    )
+    # Remove fundo cinza padrão para um visual mais limpo
+    fig_npk.update_layout(plot_bgcolor='rgba(0,0,0,0)')
+    return fig_npk.to_json()
+
+@st.cache_data(max_entries=64)
+def build_cost_fig_json(filtered_df: pd.DataFrame) -> str:
+    chart_df = filtered_df[['Produto', 'Custo_por_Ha']]
+    # Muitos produtos: mantém os mais caros e resume os restantes numa barra 'Outros' (custo médio por Ha)
+    # A barra 'Outros' conta no limite, para o total não passar de MAX_COST_BARS (e os rótulos continuarem visíveis)
+    if len(chart_df) > MAX_COST_BARS:
+        top = chart_df.nlargest(MAX_COST_BARS - 1, 'Custo_por_Ha')
+        rest = chart_df.drop(top.index)
+        other = pd.DataFrame({'Produto': ['Outros'], 'Custo_por_Ha': [rest['Custo_por_Ha'].mean()]})
+        chart_df = pd.concat([top, other], ignore_index=True)
+
+    fig_cost = go.Figure(go.Bar(
+        x=chart_df['Produto'],
+        y=chart_df['Custo_por_Ha'],
+        # Escala contínua de verdes (quanto mais caro, mais escuro)
+        marker=dict(
+            color=chart_df['Custo_por_Ha'],
+            colorscale='Greens',
+            colorbar=dict(title='Custo_por_Ha')
+        ),
+        texttemplate='%{y:.0f}' if len(chart_df) <= MAX_BAR_LABELS else None
+    ))
+    fig_cost.update_layout(
+        title="Custo Total por Hectare (€)",
+        xaxis_title='Produto',
+        yaxis_title='Custo_por_Ha',
+        plot_bgcolor='rgba(0,0,0,0)'
+    )
+    return fig_cost.to_json()
+
+@st.cache_data(max_entries=64)
+def build_efficiency_fig_json(df_chart: pd.DataFrame) -> str:
+    # Formatação Visual da Eficiência
+    # Usa um verde vibrante (LimeGreen) para destacar a eficiência
+    fig_efficiency = go.Figure(go.Bar(
+        x=df_chart['Produto'],
+        y=df_chart['Custo_Por_Unidade_N'],
+        marker_color='#32CD32',
+        texttemplate='%{y:.2f}' if len(df_chart) <= MAX_BAR_LABELS else None,
+        textposition='outside',
+        customdata=df_chart[['Custo_por_Ha', 'Unidades_N_Ha', 'Fabricante']],
+        hovertemplate=(
+            'Produto: %{x}<br>'
+            'Custo Unidade Azoto (€): %{y}<br>'
+            'Custo_por_Ha: %{customdata[0]}<br>'
+            'Unidades N / Ha: %{customdata[1]}<br>'
+            'Fabricante: %{customdata[2]}'
+            '<extra></extra>'
+        )
+    ))
+    fig_efficiency.update_layout(
+        title="Custo da Unidade de Azoto por Hectare (€)",
+        xaxis_title='Produto',
+        plot_bgcolor='rgba(0,0,0,0)'
+    )
+    fig_efficiency.update_yaxes(title_text='Custo Unidade Azoto (€)')
+    return fig_efficiency.to_json()
+
+# --- Gráficos (Fragments) ---
+# Cada gráfico é um @st.fragment: interações dentro dele só reexecutam esse bloco, não o script todo
+# A 'key' fixa em cada st.plotly_chart mantém o mesmo componente no navegador,
+# que é atualizado por diferença (Plotly.react) em vez de ser redesenhado do zero
+
+@st.fragment
+def render_npk(filtered_df: pd.DataFrame):
+    st.subheader("Composição Nutricional (N-P-K)")
     
-    clean_cols = {}
-    for col in df.columns:
-        new_col = col.strip() # Remove espaços extras no início/fim
-        
-        # Mapeamento de nomes de colunas
-        if 'N (%)' in new_col or 'N_%' in new_col: new_col = 'N'
-        elif 'P (%)' in new_col or 'P_%' in new_col: new_col = 'P'
-        elif 'K (%)' in new_col or 'K_%' in new_col: new_col = 'K'
-        elif 'Pre' in new_col and 'Est' in new_col: new_col = 'Preco_Saca'
-        # Correção crítica: Mapeia 'Total' e 'Ha' para 'Custo_por_Ha'
-        elif 'Total' in new_col and 'Ha' in new_col: new_col = 'Custo_por_Ha'
-        elif 'Saca' in new_col and 'Kg' in new_col: new_col = 'Saca_Kg'
-        
-        clean_cols[col] = new_col
+    # Verifica se as colunas necessárias existem
+    if {'N', 'P', 'K', 'Produto'}.issubset(filtered_df.columns):
+        st.plotly_chart(json.loads(build_npk_fig_json(filtered_df)), use_container_width=True, key='chart_npk')
+    else:
+        st.warning("Colunas de Nutrientes (N, P, K) não identificadas.")
+
+@st.fragment
+def render_cost(filtered_df: pd.DataFrame):
+    st.subheader("Análise de Custo por Hectare")
+    if 'Custo_por_Ha' in filtered_df.columns and 'Produto' in filtered_df.columns:
+        st.plotly_chart(json.loads(build_cost_fig_json(filtered_df)), use_container_width=True, key='chart_cost')
+    else:
+        st.warning("Coluna 'Custo_por_Ha' não identificada.")
+
+@st.fragment
+def render_efficiency(filtered_df: pd.DataFrame):
+    st.subheader("Eficiência Econômica: Custo por Unidade de Azoto")
+
+    if {'N', 'Custo_por_Ha', 'KG_por_Ha', 'Produto'}.issubset(filtered_df.columns):
+        eligible = filtered_df.loc[filtered_df['Unidades_N_Ha'] > 0]
+
+        # O utilizador escolhe quantos produtos ver; o slider só reexecuta este fragment
+        top_n = len(eligible)
+        if len(eligible) > 1:
+            top_n = st.slider("Mostrar top N", min_value=1, max_value=len(eligible), value=min(TOP_EFFICIENCY, len(eligible)))
+
+        # Ordenação parcial: só os N mais eficientes (baratos), já do mais barato para o mais caro
+        df_chart = eligible.nsmallest(top_n, 'Custo_Por_Unidade_N')
+
+        st.plotly_chart(json.loads(build_efficiency_fig_json(df_chart)), use_container_width=True, key='chart_eff')
         
-    df = df.rename(columns=clean_cols)
-    
-    # --- Conversão de Tipos ---
-    # Garante que colunas numéricas sejam tratadas como números (float), não texto
-    for col in ['N', 'P', 'K', 'Preco_Saca', 'Custo_por_Ha']:
-        if col in df.columns:
-            # erros='coerce' transforma textos não numéricos em NaN (vazio), depois preenchemos com 0
-            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-            
-    return df
-
-# Carrega os dados processados para a variável df
-df = load_and_clean_data()
+        st.info("💡 **Análise Greenkeeper:** Este gráfico mostra o custo real por Kg de Nitrogênio aplicado. Pense nisso como o 'Strokes Gained' do seu orçamento: quanto menos você paga por unidade de nutriente, mais eficiente é a sua gestão.")
+
+    else:
+        st.warning("Dados necessários (N, KG_por_Ha, Custo_por_Ha) não encontrados para calcular eficiência.")
+
+# Carrega os dados processados para a variável df, junto com as opções dos filtros
+df, categorias, fabricantes, tecnologias = load_and_clean_data()
 
 # --- Interface Principal (Main App) ---
 st.title("⛳ Comparador de Fertilizantes: Visão Greenkeeper")
@@ -70,28 +211,20 @@ if df is None:
 st.sidebar.header("Filtros de Campo")
 
 # Cria filtros dinâmicos baseados nos dados disponíveis
-# Se a coluna existir, pega os valores únicos para criar as opções
-categorias = df['Categoria'].unique() if 'Categoria' in df.columns else []
+# As opções já vêm calculadas do carregamento em cache (vazias se a coluna não existir)
 selected_cats = st.sidebar.multiselect("Categoria", options=categorias, default=categorias)
 
-fabricantes = df['Fabricante'].unique() if 'Fabricante' in df.columns else []
 selected_fabs = st.sidebar.multiselect("Fabricante", options=fabricantes, default=fabricantes)
 
-tecnologias = df['Tecnologia'].unique() if 'Tecnologia' in df.columns else []
 selected_techs = st.sidebar.multiselect("Tecnologia", options=tecnologias, default=tecnologias)
 
 # --- Aplicação dos Filtros ---
-# Cria uma máscara booleana inicial (tudo True) e vai filtrando conforme seleção
-mask = pd.Series(True, index=df.index)
-if 'Categoria' in df.columns and selected_cats:
-    mask &= df['Categoria'].isin(selected_cats)
-if 'Fabricante' in df.columns and selected_fabs:
-    mask &= df['Fabricante'].isin(selected_fabs)
-if 'Tecnologia' in df.columns and selected_techs:
-    mask &= df['Tecnologia'].isin(selected_techs)    
-    
-# Cria um novo DataFrame apenas com os dados filtrados
-filtered_df = df[mask]
+# Tuplas ordenadas são hasheáveis e estáveis, servindo de chave para o cache
+filtered_df = build_view(
+    tuple(sorted(selected_cats, key=str)),
+    tuple(sorted(selected_fabs, key=str)),
+    tuple(sorted(selected_techs, key=str)),
+)
 
 # --- Gráficos (Dashboard) ---
 
@@ -99,103 +232,15 @@ filtered_df = df[mask]
 col1, col2 = st.columns(2)
 
 with col1:
-    st.subheader("Composição Nutricional (N-P-K)")
-    
-    # Verifica se as colunas necessárias existem
-    if {'N', 'P', 'K', 'Produto'}.issubset(filtered_df.columns):
-        # Transforma os dados para formato 'longo' facilitando o gráfico agrupado
-        melted_df = filtered_df.melt(id_vars=['Produto'], value_vars=['N', 'P', 'K'], var_name='Nutriente', value_name='Porcentagem')
-        
-        # --- Cores Tema Golf ---
-        # N (Crescimento Foliar) -> Verde Escuro (DarkGreen)
-        # P (Raízes) -> Verde Oliva/Terra (DarkOliveGreen)
-        # K (Resistência) -> Verde Amarelado/Vibrante (YellowGreen)
-        golf_colors = {
-            'N': '#006400',  
-            'P': '#556B2F',  
-            'K': '#9ACD32'   
-        }
-        
-        fig_npk = px.bar(
-            melted_df, 
-            x='Produto', 
-            y='Porcentagem', 
-            color='Nutriente', 
-            title="Comparação N-P-K por Produto",
-            color_discrete_map=golf_colors, # Aplica o mapa de cores definido acima
-            text_auto=True
-        )
-        # Remove fundo cinza padrão para um visual mais limpo
-        fig_npk.update_layout(plot_bgcolor='rgba(0,0,0,0)')
-        st.plotly_chart(fig_npk, use_container_width=True)
-    else:
-        st.warning("Colunas de Nutrientes (N, P, K) não identificadas.")
+    render_npk(filtered_df)
 
 with col2:
-    st.subheader("Análise de Custo por Hectare")
-    if 'Custo_por_Ha' in filtered_df.columns and 'Produto' in filtered_df.columns:
-        fig_cost = px.bar(
-            filtered_df,
-            x='Produto',
-            y='Custo_por_Ha',
-            color='Custo_por_Ha',
-            title="Custo Total por Hectare (€)",
-            text_auto='.0f',
-            color_continuous_scale='Greens' # Escala contínua de verdes (quanto mais caro, mais escuro)
-        )
-        fig_cost.update_layout(plot_bgcolor='rgba(0,0,0,0)')
-        st.plotly_chart(fig_cost, use_container_width=True)
-    else:
-        st.warning("Coluna 'Custo_por_Ha' não identificada.")
+    render_cost(filtered_df)
 
 # --- Tabela Detalhada (Scorecard) ---
 st.subheader("Detalhes dos Produtos (Scorecard)")
-st.dataframe(filtered_df)
+# Colunas derivadas de eficiência ficam de fora da tabela original
+st.dataframe(filtered_df.drop(columns=['Unidades_N_Ha', 'Custo_Por_Unidade_N'], errors='ignore'))
 
 # --- Análise Avançada (Eficiência) ---
-st.subheader("Eficiência Econômica: Custo por Unidade de Azoto")
-
-if {'N', 'Custo_por_Ha', 'KG_por_Ha', 'Produto'}.issubset(filtered_df.columns):
-    # --- Cálculo de Eficiência ---
-    
-    # 1. Calcula quantos KG de Nitrogênio puro estamos jogando no campo por Hectare
-    # Cálculo: (Kg totais do produto por Ha) * (% de Azoto / 100)
-    filtered_df['Unidades_N_Ha'] = filtered_df['KG_por_Ha'] * (filtered_df['N'] / 100)
-    
-    # 2. Calcula quanto custa cada kg de Nitrogênio puro
-    # Cálculo: (Custo Total por Ha) / (Unidades de N por Ha)
-    # Evita divisão por zero
-    filtered_df['Custo_Por_Unidade_N'] = filtered_df.apply(
-        lambda row: row['Custo_por_Ha'] / row['Unidades_N_Ha'] if row['Unidades_N_Ha'] > 0 else 0, 
-        axis=1
-    )
-    
-    # Ordena para mostrar o mais eficiente (barato) primeiro
-    df_chart = filtered_df[filtered_df['Unidades_N_Ha'] > 0].sort_values('Custo_Por_Unidade_N')
-
-    fig_efficiency = px.bar(
-        df_chart,
-        x='Produto',
-        y='Custo_Por_Unidade_N',
-        title="Custo da Unidade de Azoto por Hectare (€)",
-        text_auto='.2f',
-        labels={
-            'Custo_Por_Unidade_N': 'Custo Unidade Azoto (€)', 
-            'Produto': 'Produto',
-            'Unidades_N_Ha': 'Unidades N / Ha'
-        },
-        hover_data=['Custo_por_Ha', 'Unidades_N_Ha', 'Fabricante']
-    )
-    
-    # Formatação Visual da Eficiência
-    # Usa um verde vibrante (LimeGreen) para destacar a eficiência
-    fig_efficiency.update_traces(marker_color='#32CD32', textposition='outside')
-    fig_efficiency.update_layout(plot_bgcolor='rgba(0,0,0,0)')
-    fig_efficiency.update_yaxes(title_text='Custo Unidade Azoto (€)')
-    
-    st.plotly_chart(fig_efficiency, use_container_width=True)
-    
-    st.info("💡 **Análise Greenkeeper:** Este gráfico mostra o custo real por Kg de Nitrogênio aplicado. Pense nisso como o 'Strokes Gained' do seu orçamento: quanto menos você paga por unidade de nutriente, mais eficiente é a sua gestão.")
-
-else:
-    st.warning("Dados necessários (N, KG_por_Ha, Custo_por_Ha) não encontrados para calcular eficiência.")
+render_efficiency(filtered_df)
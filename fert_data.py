@@ -0,0 +1,150 @@
+import streamlit as st
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import os
+import re
+from charset_normalizer import from_path
+
+# --- Dados Partilhados ---
+# Carregador único do CSV de fertilizantes, importado por todos os dashboards
+# Uma só função em cache = uma só entrada de cache servindo todas as páginas
+DATA_FILE = 'Fertilizante.csv'
+# Cópia já limpa e tipada do CSV, evita reprocessar o texto a cada arranque a frio
+PARQUET_FILE = DATA_FILE.replace('.csv', '.parquet')
+# Versão da limpeza gravada no Parquet: incrementar SEMPRE que a limpeza/tipos mudarem,
+# para que caches escritos por código antigo sejam descartados
+CLEAN_VERSION = 3
+# Chave nos metadados do esquema Parquet que identifica o CSV e a limpeza que o geraram
+CACHE_KEY_FIELD = b'fert_cache_key'
+
+# --- Mapeamento de nomes de colunas ---
+# Compilado uma única vez; a primeira expressão que casar define o nome padronizado
+RENAME_PATTERNS = [
+    (re.compile(r'N \(%\)|N_%'), 'N'),
+    (re.compile(r'P \(%\)|P_%'), 'P'),
+    (re.compile(r'K \(%\)|K_%'), 'K'),
+    (re.compile(r'Pre.*Est|Est.*Pre'), 'Preco_Saca'),
+    # Correção crítica: Mapeia 'Total' e 'Ha' para 'Custo_por_Ha'
+    (re.compile(r'Total.*Ha|Ha.*Total'), 'Custo_por_Ha'),
+    (re.compile(r'Saca.*Kg|Kg.*Saca'), 'Saca_Kg'),
+]
+
+# Tipo único para colunas de texto, seja o frame lido do CSV ou do Parquet
+TEXT_DTYPE = pd.ArrowDtype(pa.string())
+
+# --- Normalização de Tipos ---
+def is_text_column(series):
+    dtype = series.dtype
+    if isinstance(dtype, pd.ArrowDtype):
+        return pa.types.is_string(dtype.pyarrow_dtype) or pa.types.is_large_string(dtype.pyarrow_dtype)
+    return dtype == object or isinstance(dtype, pd.StringDtype)
+
+def normalize_dtypes(df):
+    # Aplicada tanto após o read_csv como após o read_parquet: os dois caminhos devolvem o mesmo frame
+
+    # --- Colunas de Filtro como Categoria ---
+    # Guardadas como códigos inteiros: menos memória e 'isin' mais rápido nos filtros
+    # Passam primeiro por TEXT_DTYPE para que as categorias tenham sempre o mesmo tipo
+    category_cols = [c for c in ['Categoria', 'Fabricante', 'Tecnologia'] if c in df.columns]
+    for col in category_cols:
+        df[col] = df[col].astype(TEXT_DTYPE).astype('category')
+    
+    # --- Conversão de Tipos ---
+    # Garante que colunas numéricas sejam tratadas como números (float), não texto
+    # float32 chega para percentagens e preços e usa metade da memória de float64
+    # Todas as colunas numéricas são convertidas de uma só vez, numa única atribuição
+    numeric_cols = [c for c in ['N', 'P', 'K', 'Preco_Saca', 'Custo_por_Ha', 'KG_por_Ha'] if c in df.columns]
+    # erros='coerce' transforma textos não numéricos em NaN (vazio), depois preenchemos com 0
+    # O preenchimento é feito em float64 numpy: em colunas Arrow o NaN não é nulo e o fillna o ignoraria
+    df[numeric_cols] = df[numeric_cols].apply(pd.to_numeric, errors='coerce').astype('float64').fillna(0).astype('float32[pyarrow]')
+
+    # Restantes colunas de texto (Produto, Característica...) ficam todas como texto Arrow
+    for col in df.columns:
+        if col not in category_cols and col not in numeric_cols and is_text_column(df[col]):
+            df[col] = df[col].astype(TEXT_DTYPE)
+
+    return df
+
+# --- Cache em Parquet ---
+def parquet_cache_key():
+    # Identifica o CSV (mtime em ns + tamanho) e a versão da limpeza que produziu o Parquet
+    stat = os.stat(DATA_FILE)
+    return f'{CLEAN_VERSION}:{stat.st_mtime_ns}:{stat.st_size}'.encode()
+
+def parquet_is_fresh(key):
+    # Só reutiliza o Parquet se a chave gravada for exatamente igual à atual
+    # Arquivo ausente, ilegível ou sem chave conta como desatualizado
+    if not os.path.exists(PARQUET_FILE):
+        return False
+    try:
+        metadata = pq.read_schema(PARQUET_FILE).metadata or {}
+    except (OSError, pa.ArrowException):
+        return False
+    return metadata.get(CACHE_KEY_FIELD) == key
+
+def write_parquet_cache(df, key):
+    # Grava a chave junto dos metadados que o pandas já coloca no esquema
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), CACHE_KEY_FIELD: key})
+    pq.write_table(table, PARQUET_FILE)
+
+# --- Carregamento e Limpeza de Dados ---
+def read_and_clean_data():
+    # Verifica se o arquivo existe antes de tentar carregar
+    if not os.path.exists(DATA_FILE):
+        return None
+
+    # Se o Parquet foi gerado a partir deste mesmo CSV e desta versão da limpeza, carrega-o diretamente
+    key = parquet_cache_key()
+    if parquet_is_fresh(key):
+        return normalize_dtypes(pd.read_parquet(PARQUET_FILE, dtype_backend='pyarrow'))
+    
+    # Deteta a codificação uma única vez (utf-8, latin1, cp1252...) em vez de tentar ler o arquivo várias vezes
+    # Se a deteção não for conclusiva, assume utf-8
+    match = from_path(DATA_FILE).best()
+    encoding = match.encoding if match is not None else 'utf-8'
+    # O leitor CSV do pyarrow é multithread e bem mais rápido que o padrão
+    # Com dtype_backend='pyarrow' as colunas já são Arrow: o st.dataframe não precisa de as converter
+    df = pd.read_csv(DATA_FILE, encoding=encoding, engine='pyarrow', dtype_backend='pyarrow')
+            
+    # --- Padronização dos Nomes das Colunas ---
+    # O objetivo é garantir que o código entenda as colunas independentemente de pequenas variações no CSV
+    # Exemplo: 'N (%)' vira apenas 'N'
+    
+    clean_cols = {}
+    for col in df.columns:
+        new_col = col.strip() # Remove espaços extras no início/fim
+        
+        # Mapeamento de nomes de colunas (ver RENAME_PATTERNS)
+        for pattern, name in RENAME_PATTERNS:
+            if pattern.search(new_col):
+                new_col = name
+                break
+        
+        clean_cols[col] = new_col
+        
+    df = df.rename(columns=clean_cols)
+    df = normalize_dtypes(df)
+
+    # Grava a versão limpa em Parquet (mantém também o tipo 'category')
+    # Em pastas só de leitura o dashboard continua a funcionar a partir do CSV
+    try:
+        write_parquet_cache(df, key)
+    except OSError:
+        pass
+            
+    return df
+
+# @st.cache_data armazena o resultado da função em cache para acelerar o recarregamento
+# Devolve também as opções de cada filtro, calculadas uma única vez junto com os dados
+@st.cache_data
+def load_and_clean_data():
+    df = read_and_clean_data()
+    if df is None:
+        return None, (), (), ()
+
+    def filter_options(col):
+        return tuple(df[col].cat.categories.tolist()) if col in df.columns else ()
+
+    return df, filter_options('Categoria'), filter_options('Fabricante'), filter_options('Tecnologia')